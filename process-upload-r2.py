@@ -4,108 +4,345 @@ Image Processing Script for R2 Upload
 Processes PNG images matching naming convention, converts to JPG, uploads to R2, and cleans up local files.
 """
 
+import asyncio
+import atexit
+import io
 import os
 import re
+import sys
 import logging
+import multiprocessing
+import queue
 import time
+from logging.handlers import QueueHandler, QueueListener
 from pathlib import Path
-from typing import List, Optional, Tuple
+from typing import Deque, List, Optional, Tuple
 import boto3
-from botocore.exceptions import ClientError, NoCredentialsError
-from PIL import Image, ImageFile
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from botocore.exceptions import NoCredentialsError
+from PIL import Image, ImageFile, features
+from tqdm import tqdm
 import argparse
 import sqlite3
-from datetime import datetime
 import json
 import configparser
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from threading import Lock
+from collections import deque
+from contextlib import nullcontext, suppress
+from functools import lru_cache
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
+from threading import Lock, local
+
+# Optional: PyTurboJPEG encodes straight from a numpy array via libjpeg-turbo (--encoder turbojpeg/auto)
+try:
+    import numpy as np
+    from turbojpeg import TurboJPEG, TJPF_RGB, TJSAMP_420
+except ImportError:
+    TurboJPEG = None
+
+# Optional: orjson parses JSON config files faster than the stdlib
+try:
+    from orjson import loads as _json_loads
+except ImportError:
+    _json_loads = json.loads
+
+# Optional: aioboto3 drives many concurrent uploads from one event loop (--async)
+try:
+    import aioboto3
+except ImportError:
+    aioboto3 = None
 
 # Enable loading of truncated images
 ImageFile.LOAD_TRUNCATED_IMAGES = True
 
-# Configure logging
+# Configure logging: worker threads only enqueue records, a background listener writes the file
+_log_file_handler = logging.FileHandler('image_processor.log')
+_log_file_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+_log_queue = queue.SimpleQueue()
+_log_queue_handler = QueueHandler(_log_queue)
+_log_queue_handler.setFormatter(logging.Formatter('%(message)s'))  # Final formatting happens in the listener
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
     handlers=[
-        logging.FileHandler('image_processor.log')
+        _log_queue_handler
         # Only log to file, not console
     ]
 )
+_log_listener = QueueListener(_log_queue, _log_file_handler)
+_log_listener.start()
+atexit.register(_log_listener.stop)
 logger = logging.getLogger(__name__)
 
+class _ConsoleLogHandler(logging.Handler):
+    """Listener-side console output for --log-console, printed above the progress bar rather than through it"""
+    def emit(self, record):
+        try:
+            tqdm.write(self.format(record), file=sys.stderr)
+        except Exception:
+            self.handleError(record)
+
+def _enable_console_logging():
+    """Also send log records to the console; written by the listener thread, so workers still only enqueue"""
+    console_handler = _ConsoleLogHandler()
+    console_handler.setFormatter(logging.Formatter('%(levelname)s - %(message)s'))
+    # The listener reads its handlers tuple per record, so swapping in a new tuple is safe while it runs
+    _log_listener.handlers = _log_listener.handlers + (console_handler,)
+
+# Filename format: pregen_{id}-{seed}_{sequence}_ (matched against the stem)
+_FILENAME_RE = re.compile(r'pregen_(\d+)-(\d+)_\d+_\Z')
+_FILENAME_PREFIX = 'pregen_'
+
+# Default --pattern: only pregen files, so every match can take the strict parse
+PREGEN_PATTERN = r"pregen_\d+-\d+_\d+_\.png$"
+# Compiled once for every instance using the default. Generated names are always lowercase, so unlike
+# user patterns it is matched case-sensitively (no case folding), and anchored with \Z so a trailing
+# newline can't slip past '$'
+_PREGEN_REGEX = re.compile(r"pregen_\d+-\d+_\d+_\.png\Z")
+
+# Up to this many images are checked against the tracker by key; larger runs load the uploaded set instead
+_PREFETCH_BY_KEY_MAX = 500
+
+# Host parameters per IN (...) lookup: under SQLite's old 999-variable limit, and every full chunk
+# reuses the same statement from the connection's statement cache
+_IN_CLAUSE_CHUNK = 500
+
+# Threads listing directories in parallel for --recursive
+_SCAN_WORKERS = 8
+
+# TurboJPEG handle of a process-pool worker (set by _init_transcode_worker)
+_worker_turbojpeg = None
+
+def encode_png_to_jpg(png_path: Path, save_kwargs: dict, turbojpeg=None,
+                      max_dimension: Optional[int] = None) -> Tuple[bytes, bool]:
+    """Decode a PNG, optionally downscale it, flatten it onto white and return (JPEG bytes, whether it was already RGB)"""
+    # Open and convert image
+    with Image.open(png_path) as img:
+        # Decode once up front instead of lazily on first pixel access
+        img.load()
+        
+        already_rgb = img.mode == 'RGB'
+        
+        # Convert RGBA to RGB if necessary
+        if img.mode == 'P':
+            # Only a palette with a transparent entry needs compositing; otherwise expand straight to RGB
+            img = img.convert('RGBA' if 'transparency' in img.info else 'RGB')
+        
+        # Downscale before compositing/encoding so every later step touches fewer pixels
+        if max_dimension:
+            img.thumbnail((max_dimension, max_dimension), Image.Resampling.LANCZOS)
+        
+        if img.mode == 'RGB':
+            # Fast path (the usual pregen output): nothing to convert or composite, encode as-is
+            pass
+        elif img.mode in ('RGBA', 'LA'):
+            # Extrema of the alpha band only, rather than of every band
+            if img.getchannel('A').getextrema() == (255, 255):
+                # Fully opaque: compositing onto white is a no-op, just drop the alpha channel
+                img = img.convert('RGB')
+            else:
+                # Composite onto white with Pillow's C paste (about 5x faster than a NumPy uint16 blend)
+                background = Image.new('RGB', img.size, (255, 255, 255))
+                background.paste(img, mask=img.getchannel('A'))
+                img = background
+        else:
+            img = img.convert('RGB')
+        
+        # Encode as JPG
+        if turbojpeg:
+            return turbojpeg.encode(
+                np.asarray(img), quality=save_kwargs['quality'],
+                pixel_format=TJPF_RGB, jpeg_subsample=TJSAMP_420
+            ), already_rgb
+        buf = io.BytesIO()
+        img.save(buf, **save_kwargs)
+        return buf.getvalue(), already_rgb
+
+def _progress_bar(total: int) -> tqdm:
+    """Progress bar for a run; disabled when stderr isn't a terminal so cron/provisioning logs stay clean"""
+    # mininterval bounds redraws however fast files complete
+    return tqdm(total=total, unit='img', disable=None, mininterval=0.5, smoothing=0.1)
+
+def _exc_detail(e: Exception) -> str:
+    """Short description of an exception for an error record"""
+    return f"{type(e).__name__}: {e}"
+
+def format_error(error: Tuple[str, str, Optional[str]]) -> str:
+    """Render a (path, stage, detail) error record as a log line"""
+    path, stage, detail = error
+    message = f"{stage} failed: {Path(path).name}"
+    return f"{message} ({detail})" if detail else message
+
+def _init_transcode_worker(encoder: str):
+    """Process-pool initializer: TurboJPEG handles can't be pickled, so each worker loads its own"""
+    global _worker_turbojpeg
+    if encoder == 'turbojpeg':
+        _worker_turbojpeg = TurboJPEG()
+
+def _transcode_worker(png_path: str, save_kwargs: dict, max_dimension: Optional[int]) -> Tuple[bytes, bool]:
+    """Process-pool entry point for encode_png_to_jpg"""
+    return encode_png_to_jpg(Path(png_path), save_kwargs, _worker_turbojpeg, max_dimension)
+
 class UploadTracker:
-    def __init__(self, db_path: str = "upload_tracker.db"):
-        # Always place database in the same directory as the script
-        script_dir = Path(__file__).parent.absolute()
-        if not os.path.isabs(db_path):
-            self.db_path = script_dir / db_path
+    def __init__(self, db_path: str = "upload_tracker.db", mode: str = 'disk'):
+        """
+        Args:
+            db_path: SQLite file, relative to the script directory unless absolute
+            mode: 'disk' to persist uploads across runs, or 'memory' to track them for this process only
+        """
+        self.mode = mode
+        # On disk, WAL plus BEGIN IMMEDIATE and the connection's busy timeout order concurrent writers.
+        # Shared-cache table locks fail at once instead of waiting, so memory mode serializes writes itself
+        self._write_lock = Lock() if mode == 'memory' else nullcontext()
+        # One connection per worker thread, reused across lookups; all are tracked so close() can reach them
+        self._local = local()
+        self._connections = []
+        self._connections_lock = Lock()
+        
+        self._anchor = None
+        if mode == 'memory':
+            # A plain ':memory:' database is private to one connection; a named shared-cache one is seen
+            # by every thread's connection and lives as long as the anchor connection stays open
+            self.db_path = f"file:upload_tracker_{id(self)}?mode=memory&cache=shared"
+            self._anchor = sqlite3.connect(self.db_path, uri=True, check_same_thread=False)
         else:
-            self.db_path = Path(db_path)
-        self.db_lock = Lock()
+            # Always place database in the same directory as the script
+            script_dir = Path(__file__).parent.absolute()
+            if not os.path.isabs(db_path):
+                self.db_path = script_dir / db_path
+            else:
+                self.db_path = Path(db_path)
         self.init_db()
     
+    def _connect(self) -> sqlite3.Connection:
+        """Open a connection with the tracker's per-connection settings applied"""
+        # isolation_level=None: autocommit, so lookups never leave an implicit transaction open;
+        # multi-statement writes issue their own BEGIN
+        if self._anchor:
+            return sqlite3.connect(self.db_path, uri=True, check_same_thread=False, isolation_level=None)
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+        # Not persisted in the file, so every connection sets them; with WAL, NORMAL makes a commit
+        # an append to the log without a full fsync
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA mmap_size=268435456")
+        # 64 MiB page cache (default ~2 MiB) so the primary key index stays hot as the table grows
+        conn.execute("PRAGMA cache_size=-65536")
+        return conn
+    
+    def _connection(self) -> sqlite3.Connection:
+        """Return this thread's SQLite connection, opening it on first use"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+    
     def init_db(self):
         """Initialize SQLite database with upload tracking table"""
-        with sqlite3.connect(self.db_path) as conn:
+        conn = self._connection()
+        if not self._anchor:
+            # Only takes effect while the file is still empty, i.e. before WAL is switched on below
+            conn.execute("PRAGMA page_size=8192")
+            # WAL is persistent in the database file and lets lookups run while a batch is being written
+            # (an in-memory database has no journal file, so there is nothing to switch)
+            conn.execute("PRAGMA journal_mode=WAL")
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(upload_status)")}
+        if 'status' in columns:
+            self._migrate_status_table(conn)
+        # A row's presence means the card was uploaded; WITHOUT ROWID stores rows in the primary key
+        # B-tree itself, so lookups don't go through a separate index
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS upload_status (
+                card_id TEXT PRIMARY KEY,
+                ts INTEGER NOT NULL
+            ) WITHOUT ROWID
+        """)
+    
+    def _migrate_status_table(self, conn: sqlite3.Connection):
+        """Convert a tracker from the (card_id, status, timestamp) schema, keeping its uploaded rows"""
+        logger.info("Migrating upload tracker to the compact schema")
+        with self._write_lock, conn:
+            conn.execute("BEGIN IMMEDIATE")
             conn.execute("""
-                CREATE TABLE IF NOT EXISTS upload_status (
+                CREATE TABLE upload_status_new (
                     card_id TEXT PRIMARY KEY,
-                    status TEXT NOT NULL,
-                    timestamp TEXT NOT NULL
-                )
+                    ts INTEGER NOT NULL
+                ) WITHOUT ROWID
             """)
-            conn.commit()
+            # Old timestamps are local-time ISO strings; store them as Unix seconds like new rows
+            conn.execute("""
+                INSERT INTO upload_status_new (card_id, ts)
+                SELECT card_id, COALESCE(CAST(strftime('%s', timestamp, 'utc') AS INTEGER), 0)
+                FROM upload_status WHERE status = 'uploaded'
+            """)
+            conn.execute("DROP TABLE upload_status")
+            conn.execute("ALTER TABLE upload_status_new RENAME TO upload_status")
+    
+    def close(self):
+        """Run PRAGMA optimize and close every connection opened by this tracker (memory mode keeps its data)"""
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+            self._local = local()
+        for i, conn in enumerate(connections):
+            try:
+                if i == 0:
+                    conn.execute("PRAGMA optimize")
+                conn.close()
+            except sqlite3.Error as e:
+                logger.warning(f"Failed to close upload tracker connection: {e}")
     
     def is_uploaded(self, card_id: str) -> bool:
         """Check if card_id has already been uploaded"""
-        with self.db_lock:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.execute(
-                    "SELECT status FROM upload_status WHERE card_id = ? AND status = 'uploaded'",
-                    (card_id,)
-                )
-                return cursor.fetchone() is not None
+        cursor = self._connection().execute(
+            "SELECT 1 FROM upload_status WHERE card_id = ? LIMIT 1",
+            (card_id,)
+        )
+        return cursor.fetchone() is not None
     
     def mark_uploaded(self, card_id: str):
         """Mark card_id as uploaded"""
-        with self.db_lock:
-            with sqlite3.connect(self.db_path) as conn:
-                conn.execute("""
-                    INSERT OR REPLACE INTO upload_status (card_id, status, timestamp)
-                    VALUES (?, 'uploaded', ?)
-                """, (card_id, datetime.now().isoformat()))
-                conn.commit()
+        with self._write_lock:
+            # An existing row already records the upload: IGNORE leaves it alone where REPLACE would
+            # delete and re-insert it
+            self._connection().execute(
+                "INSERT OR IGNORE INTO upload_status (card_id, ts) VALUES (?, ?)",
+                (card_id, int(time.time()))
+            )
     
     def batch_mark_uploaded(self, card_ids: List[str]):
         """Mark multiple card_ids as uploaded in a single transaction"""
         if not card_ids:
             return
         
-        with self.db_lock:
-            with sqlite3.connect(self.db_path) as conn:
-                timestamp = datetime.now().isoformat()
-                data = [(card_id, 'uploaded', timestamp) for card_id in card_ids]
-                conn.executemany("""
-                    INSERT OR REPLACE INTO upload_status (card_id, status, timestamp)
-                    VALUES (?, ?, ?)
-                """, data)
-                conn.commit()
+        with self._write_lock, self._connection() as conn:
+            timestamp = int(time.time())
+            # Take the write lock up front rather than upgrading a deferred transaction mid-batch
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany(
+                "INSERT OR IGNORE INTO upload_status (card_id, ts) VALUES (?, ?)",
+                ((card_id, timestamp) for card_id in card_ids)
+            )
+    
+    def load_uploaded_set(self) -> set:
+        """Return every card_id recorded as uploaded, for in-memory lookups during a run"""
+        cursor = self._connection().execute("SELECT card_id FROM upload_status")
+        return {row[0] for row in cursor}
     
     def batch_check_uploaded(self, card_ids: List[str]) -> set:
         """Check multiple card_ids and return set of already uploaded ones"""
         if not card_ids:
             return set()
         
-        with self.db_lock:
-            with sqlite3.connect(self.db_path) as conn:
-                placeholders = ','.join('?' * len(card_ids))
-                cursor = conn.execute(
-                    f"SELECT card_id FROM upload_status WHERE card_id IN ({placeholders}) AND status = 'uploaded'",
-                    card_ids
-                )
-                return {row[0] for row in cursor.fetchall()}
+        conn = self._connection()
+        uploaded = set()
+        for start in range(0, len(card_ids), _IN_CLAUSE_CHUNK):
+            chunk = card_ids[start:start + _IN_CLAUSE_CHUNK]
+            placeholders = ','.join('?' * len(chunk))
+            cursor = conn.execute(f"SELECT card_id FROM upload_status WHERE card_id IN ({placeholders})", chunk)
+            uploaded.update(row[0] for row in cursor)
+        return uploaded
 
 class ImageProcessor:
     def __init__(self, 
@@ -116,8 +353,17 @@ class ImageProcessor:
                  r2_secret_key: str = None,
                  bucket_name: str = None,
                  jpg_quality: int = 85,
+                 optimize_jpeg: bool = False,
                  track_uploads: bool = True,
-                 max_workers: int = 4):
+                 max_workers: Optional[int] = None,
+                 encoder: str = 'auto',
+                 processes: int = 0,
+                 max_dimension: Optional[int] = None,
+                 multipart_threshold: int = 8 * 1024 * 1024,
+                 multipart_chunksize: int = 8 * 1024 * 1024,
+                 s3_concurrency: int = 8,
+                 recursive: bool = False,
+                 tracker_mode: str = 'disk'):
         """
         Initialize the ImageProcessor
         
@@ -129,71 +375,208 @@ class ImageProcessor:
             r2_secret_key: R2 secret key
             bucket_name: R2 bucket name
             jpg_quality: JPEG quality (1-100, default: 85)
+            optimize_jpeg: Compute optimal Huffman tables for a few % smaller files at roughly twice
+                the encode CPU (Pillow encoder only, default: False)
             track_uploads: Whether to track uploaded files to avoid duplicates
-            max_workers: Maximum number of concurrent workers (default: 4)
+            max_workers: Maximum number of concurrent workers (default: min(32, cpu_count * 4))
+            encoder: JPEG encoder, 'pillow', 'turbojpeg' (requires PyTurboJPEG) or 'auto'
+                (turbojpeg when available, else pillow)
+            processes: Number of processes for PNG decode/JPEG encode, -1 for one per CPU
+                (default: 0, encode in the worker threads)
+            max_dimension: Downscale images so neither side exceeds this many pixels (default: keep size)
+            multipart_threshold: Size in bytes from which uploads are split into parts (default: 8 MiB)
+            multipart_chunksize: Part size in bytes for multipart uploads (default: 8 MiB)
+            s3_concurrency: Parts uploaded in parallel per multipart upload (default: 8)
+            recursive: Also scan subdirectories of directory (default: top level only)
+            tracker_mode: 'disk' (upload_tracker.db) or 'memory' (forget uploads when the process exits)
         """
         self.directory = Path(directory)
-        self.naming_pattern = re.compile(naming_pattern, re.IGNORECASE)
+        self.recursive = recursive
+        if naming_pattern == r".*\.png$":
+            # The default pattern only checks the extension: a suffix compare is cheaper than the regex
+            self._fast_suffix = '.png'
+            self.naming_pattern = None
+        elif naming_pattern == PREGEN_PATTERN:
+            self._fast_suffix = None
+            self.naming_pattern = _PREGEN_REGEX
+        else:
+            self._fast_suffix = None
+            self.naming_pattern = re.compile(naming_pattern, re.IGNORECASE)
+        # Files found with the pregen pattern are already validated, so parsing can skip the checks
+        self._pregen_only = naming_pattern == PREGEN_PATTERN
         self.bucket_name = bucket_name
         self.jpg_quality = jpg_quality
+        # Pillow save options, built once rather than per image
+        self.save_kwargs = {
+            'format': 'JPEG',
+            'quality': jpg_quality,
+            # Off by default: a second Huffman pass costs far more CPU than the few % of size it saves
+            'optimize': optimize_jpeg,
+            'progressive': False,
+            'subsampling': 2  # 4:2:0
+        }
+        self.max_dimension = max_dimension
+        if max_workers is None:
+            max_workers = min(32, (os.cpu_count() or 1) * 4)
+        elif max_workers < 1:
+            raise ValueError(f"max_workers must be at least 1, got {max_workers}")
         self.max_workers = max_workers
-        self.tracker = UploadTracker() if track_uploads else None
+        self.tracker = UploadTracker(mode=tracker_mode) if track_uploads else None
+        
+        self.processes = (os.cpu_count() or 1) if processes < 0 else processes
+        self._encode_pool = None
+        # Images that needed no mode conversion before encoding (reported at DEBUG after each run)
+        self._fast_rgb_count = 0
+        self._stats_lock = Lock()
+        self.turbojpeg = None
+        if encoder == 'auto':
+            # Prefer libjpeg-turbo when both PyTurboJPEG and the shared library are present
+            # (and optimized Huffman tables, which only Pillow's save path offers, weren't asked for)
+            encoder = 'pillow'
+            if TurboJPEG is not None and not optimize_jpeg:
+                try:
+                    self.turbojpeg = TurboJPEG()
+                    encoder = 'turbojpeg'
+                except (OSError, RuntimeError) as e:
+                    logger.warning(f"libturbojpeg unavailable, falling back to Pillow: {e}")
+        elif encoder == 'turbojpeg':
+            if TurboJPEG is None:
+                raise ValueError("encoder 'turbojpeg' requires PyTurboJPEG (pip install PyTurboJPEG)")
+            self.turbojpeg = TurboJPEG()
+            if optimize_jpeg:
+                logger.warning("--optimize-jpeg has no effect with the turbojpeg encoder")
+        self.encoder = encoder
+        if encoder == 'pillow' and not features.check_feature('libjpeg_turbo'):
+            # Official Pillow wheels bundle libjpeg-turbo; a source build against plain libjpeg encodes
+            # several times slower (Pillow-SIMD builds are faster still, as a drop-in replacement)
+            logger.warning("Pillow is not built with libjpeg-turbo; JPEG encoding will be slow. "
+                           "Install the official Pillow wheel or PyTurboJPEG (--encoder turbojpeg)")
+        
+        # Headers shared by every uploaded object, built once; put_object takes them as keyword arguments
+        self._object_headers = {
+            'ContentType': 'image/jpeg',
+            'CacheControl': 'public, max-age=31536000, immutable',
+            'ContentEncoding': 'identity'
+        }
+        
+        # Multipart settings for upload_fileobj: images past the threshold are split into parts uploaded concurrently.
+        # Generated JPEGs are far below the threshold, so they go out as a single PUT
+        self.transfer_config = TransferConfig(
+            multipart_threshold=multipart_threshold,
+            multipart_chunksize=multipart_chunksize,
+            max_concurrency=s3_concurrency,
+            use_threads=True
+        )
         
         # Initialize R2 client
         self.s3_client = None
+        self._client_kwargs = None
         if all([r2_endpoint, r2_access_key, r2_secret_key]):
+            # Kept for process_images_async, which opens its own aioboto3 client
+            self._client_kwargs = {
+                'endpoint_url': r2_endpoint,
+                'aws_access_key_id': r2_access_key,
+                'aws_secret_access_key': r2_secret_key,
+                'region_name': 'auto'  # R2 uses 'auto' region
+            }
+            # Keep connections (and their TLS sessions) warm across the whole batch
+            self._client_config = Config(
+                signature_version='s3v4',
+                # The client is shared by all worker threads; size the pool so they don't queue
+                # (botocore's default of 10 would cap PUTs below max_workers), with headroom for
+                # multipart parts and retries holding a second connection. Connections open lazily
+                max_pool_connections=max(self.max_workers * 2, 20),
+                # Adaptive mode backs off client-side on throttling, so fewer attempts are needed
+                retries={'max_attempts': 5, 'mode': 'adaptive'},
+                tcp_keepalive=True,
+                s3={
+                    'addressing_style': 'virtual',
+                    'use_accelerate_endpoint': False,
+                    # Skip SHA-256 hashing every body for SigV4 (the CRC32 checksum header is still sent).
+                    # Only safe when TLS protects the payload, so plain-http endpoints keep signing it
+                    'payload_signing_enabled': not r2_endpoint.lower().startswith('https://')
+                }
+            )
             try:
-                self.s3_client = boto3.client(
-                    's3',
-                    endpoint_url=r2_endpoint,
-                    aws_access_key_id=r2_access_key,
-                    aws_secret_access_key=r2_secret_key,
-                    region_name='auto'  # R2 uses 'auto' region
-                )
+                self.s3_client = boto3.client('s3', **self._client_kwargs, config=self._client_config)
             except Exception as e:
                 logger.error(f"Failed to initialize R2 client: {e}")
                 raise
     
     def find_matching_images(self) -> List[Path]:
-        """Find PNG images matching the naming convention"""
+        """Find PNG images matching the naming convention (in subdirectories too when recursive)"""
         if not self.directory.exists():
             return []
         
+        if not self.recursive:
+            return self._scan_directory(self.directory)[0]
+        
+        # Each directory is one task; subdirectories found by a task are submitted from this thread,
+        # so results are merged here without a shared lock
         matching_files = []
-        for file_path in self.directory.iterdir():
-            if file_path.is_file() and self.naming_pattern.match(file_path.name):
-                matching_files.append(file_path)
+        with ThreadPoolExecutor(max_workers=_SCAN_WORKERS) as executor:
+            pending = {executor.submit(self._scan_directory, self.directory)}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    try:
+                        files, subdirs = future.result()
+                    except OSError as e:
+                        logger.warning(f"Failed to scan directory: {e}")
+                        continue
+                    matching_files.extend(files)
+                    pending.update(executor.submit(self._scan_directory, subdir) for subdir in subdirs)
         
         return matching_files
     
-    def convert_png_to_jpg(self, png_path: Path) -> Optional[Path]:
-        """Convert PNG to JPG format"""
-        try:
-            # Get processed filename for the JPG
-            processed_filename, _ = self.process_filename_for_upload(png_path)
-            jpg_path = png_path.parent / processed_filename
-            
-            # Open and convert image
-            with Image.open(png_path) as img:
-                # Convert RGBA to RGB if necessary
-                if img.mode in ('RGBA', 'LA', 'P'):
-                    # Create white background
-                    background = Image.new('RGB', img.size, (255, 255, 255))
-                    if img.mode == 'P':
-                        img = img.convert('RGBA')
-                    background.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
-                    img = background
-                elif img.mode != 'RGB':
-                    img = img.convert('RGB')
-                
-                # Save as JPG
-                img.save(jpg_path, 'JPEG', quality=self.jpg_quality, optimize=True)
-                return jpg_path
-                
-        except Exception as e:
-            return None
+    def _scan_directory(self, directory) -> Tuple[List[Path], List[str]]:
+        """List one directory: (matching image paths, subdirectory paths when recursive)"""
+        matching_files = []
+        subdirs = []
+        # scandir's DirEntry.is_file() uses the d_type from readdir, avoiding a stat() per entry
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                name = entry.name
+                if self._fast_suffix:
+                    matched = name.lower().endswith(self._fast_suffix)
+                else:
+                    matched = self.naming_pattern.match(name)
+                if matched and entry.is_file(follow_symlinks=False):
+                    matching_files.append(Path(entry.path))
+                elif self.recursive and entry.is_dir(follow_symlinks=False):
+                    # Symlinked directories are not followed, so the walk can't loop
+                    subdirs.append(entry.path)
+        
+        return matching_files, subdirs
+    
+    def encode_jpg(self, png_path: Path) -> bytes:
+        """Decode a PNG and return it encoded as JPEG bytes"""
+        if self._encode_pool:
+            # Hand the CPU-bound decode/encode to the process pool; this thread just waits for the bytes
+            jpg_bytes, already_rgb = self._encode_pool.submit(
+                _transcode_worker, str(png_path), self.save_kwargs, self.max_dimension
+            ).result()
+        else:
+            jpg_bytes, already_rgb = encode_png_to_jpg(png_path, self.save_kwargs, self.turbojpeg, self.max_dimension)
+        if already_rgb:
+            with self._stats_lock:
+                self._fast_rgb_count += 1
+        return jpg_bytes
     
-    def process_filename_for_upload(self, file_path: Path) -> tuple[str, dict]:
+    async def encode_jpg_async(self, png_path: Path) -> bytes:
+        """Awaitable encode_jpg: awaits the process pool directly instead of parking a thread on it"""
+        if not self._encode_pool:
+            return await asyncio.to_thread(self.encode_jpg, png_path)
+        jpg_bytes, already_rgb = await asyncio.get_running_loop().run_in_executor(
+            self._encode_pool, _transcode_worker, str(png_path), self.save_kwargs, self.max_dimension
+        )
+        if already_rgb:
+            # Only the event loop thread gets here, but encode_jpg may be counting from other threads
+            with self._stats_lock:
+                self._fast_rgb_count += 1
+        return jpg_bytes
+    
+    def process_filename_for_upload(self, file_path: Path) -> tuple[str, dict, str]:
         """
         Process filename for your specific format: 1418510004060-890774523686991_00001_.png
         
@@ -201,89 +584,88 @@ class ImageProcessor:
             file_path: Local file path
             
         Returns:
-            Tuple of (processed_filename, metadata_dict)
+            Tuple of (processed_filename, metadata_dict, card_id), card_id being processed_filename
+            without its .jpg extension
         """
-        filename = file_path.stem  # Get filename without extension
+        # Get filename without extension (slicing off '.png' is cheaper than Path.stem, which re-splits the name)
+        name = file_path.name
+        filename = name[:-4] if len(name) > 4 and name[-4:].lower() == '.png' else file_path.stem
         
         # Parse the filename format: pregen_{id}-{seed}_{sequence}_
         # Expected pattern: pregen_1418510004060-890774523686991_00001_
-        pattern = r'^pregen_(\d+)-(\d+)_\d+_$'
-        
-        match = re.match(pattern, filename)
+        match = _FILENAME_RE.match(filename)
         
         if match:
-            file_id = match.group(1)  # 1418510004060
-            seed_value = match.group(2)  # 890774523686991
+            file_id, seed_value = match.groups()  # 1418510004060, 890774523686991
             
             processed_filename = f"{file_id}.jpg"
             metadata = {
                 'seed': seed_value
             }
             
-            return processed_filename, metadata
+            return processed_filename, metadata, file_id
         else:
             # Fallback for non-matching filenames
             processed_filename = f"{filename}.jpg"
             metadata = {}
-            return processed_filename, metadata
+            return processed_filename, metadata, filename
     
-    def upload_to_r2(self, file_path: Path, object_key: Optional[str] = None, metadata: Optional[dict] = None) -> bool:
-        """Upload file to R2 bucket"""
+    def process_filename_strict(self, file_path: Path) -> tuple[str, dict, str]:
+        """
+        process_filename_for_upload for names already matched against PREGEN_PATTERN: slices out the
+        id and seed without re-validating them
+        """
+        name = file_path.name
+        file_id, _, rest = name[len(_FILENAME_PREFIX):-4].partition('-')
+        return f"{file_id}.jpg", {'seed': rest.partition('_')[0]}, file_id
+    
+    def upload_bytes_to_r2(self, jpg_bytes: bytes, object_key: str, metadata: Optional[dict] = None):
+        """Upload an in-memory JPEG to R2 bucket; client errors propagate so the caller can record why"""
         if not self.s3_client:
-            logger.error("R2 client not initialized")
-            return False
-        
-        if not object_key:
-            object_key, file_metadata = self.process_filename_for_upload(file_path)
-            # Use file metadata if no metadata was passed
-            if not metadata:
-                metadata = file_metadata
-        
-        # Prepare upload arguments
-        extra_args = {
-            'ContentType': 'image/jpeg'
-        }
-        
-        # Add metadata if provided
-        if metadata:
-            extra_args['Metadata'] = metadata
+            raise RuntimeError("R2 client not initialized")
         
-        try:
-            # Read full file content into memory first
-            with open(file_path, 'rb') as file_data:
-                file_bytes = file_data.read()
-            
-            # Upload with complete file bytes in body
+        # Same cut-over as upload_fileobj itself
+        if len(jpg_bytes) < self.transfer_config.multipart_threshold:
+            # One request with the bytes as-is (no copy); upload_fileobj would re-read them in chunks
             self.s3_client.put_object(
                 Bucket=self.bucket_name,
                 Key=object_key,
-                Body=file_bytes,
-                ContentType='image/jpeg',
-                CacheControl='public, max-age=31536000, immutable',
-                ContentEncoding='identity',
-                Metadata=metadata or {}
+                Body=jpg_bytes,
+                ContentLength=len(jpg_bytes),
+                Metadata=metadata or {},
+                **self._object_headers
             )
-            return True
-            
-        except ClientError as e:
-            return False
-        except Exception as e:
-            return False
+            return
+        
+        self.s3_client.upload_fileobj(
+            io.BytesIO(jpg_bytes),
+            self.bucket_name,
+            object_key,
+            ExtraArgs=self._upload_extra_args(metadata),
+            Config=self.transfer_config
+        )
+    
+    def _upload_extra_args(self, metadata: Optional[dict]) -> dict:
+        """ExtraArgs for the transfer manager; a fresh dict since it may add its own defaults to it"""
+        return {**self._object_headers, 'Metadata': metadata or {}}
     
-    def cleanup_files(self, png_path: Path, jpg_path: Path, keep_converted: bool = False):
-        """Remove local files after successful upload"""
+    def cleanup_files(self, png_path: Path):
+        """Remove the source PNG after a successful upload (a JPG on disk is only ever one being kept)"""
+        # Just unlink: checking exists() first costs an extra stat() per file
         try:
-            if png_path.exists():
-                png_path.unlink()
-            
-            if not keep_converted and jpg_path.exists():
-                jpg_path.unlink()
-                
-        except Exception as e:
+            os.unlink(png_path)
+        except FileNotFoundError:
             pass
+        except OSError as e:
+            logger.warning(f"Failed to remove {png_path}: {e}")
     
-    def process_single_image(self, png_path: Path, cleanup_on_success: bool = True, keep_converted: bool = False) -> dict:
-        """Process a single image (for use in concurrent processing)"""
+    def process_single_image(self, png_path: Path, cleanup_on_success: bool = True, keep_converted: bool = False,
+                             parsed: Optional[Tuple[str, dict, str]] = None) -> dict:
+        """Process a single image (for use in concurrent processing)
+        
+        parsed is the (processed_filename, metadata, card_id) tuple from process_filename_for_upload when the caller
+        already has it
+        """
         result = {
             'processed': 0,
             'converted': 0,
@@ -294,69 +676,61 @@ class ImageProcessor:
         }
         
         try:
-            # Cache filename processing to avoid redundant calls
-            processed_filename, metadata = self.process_filename_for_upload(png_path)
-            card_id = processed_filename.replace('.jpg', '')
-            result['card_id'] = card_id
-            
-            # Check if already uploaded (thread-safe)
-            if self.tracker and self.tracker.is_uploaded(card_id):
-                message = f"⏩ {png_path.name} - already uploaded (skipped)"
-                print(message)
-                logger.info(message)
-                return result
-            
+            processed_filename, metadata, result['card_id'] = parsed or self.process_filename_for_upload(png_path)
             result['processed'] = 1
             
-            # Convert PNG to JPG
-            jpg_path = self.convert_png_to_jpg(png_path)
-            if not jpg_path:
-                message = f"❌ {png_path.name} - conversion failed"
-                print(message)
-                logger.info(message)
-                result['errors'].append(f"Conversion failed: {png_path.name}")
+            try:
+                jpg_bytes = self.encode_jpg(png_path)
+            except Exception as e:
+                logger.debug("❌ %s - conversion failed", png_path.name)
+                result['errors'].append((str(png_path), 'Conversion', _exc_detail(e)))
                 return result
             
+            # The JPG goes to R2 from memory; it only touches the disk when it is kept after the run
+            jpg_path = None
+            if keep_converted or not cleanup_on_success:
+                jpg_path = png_path.parent / processed_filename
+                try:
+                    jpg_path.write_bytes(jpg_bytes)
+                except OSError as e:
+                    logger.debug("❌ %s - conversion failed", png_path.name)
+                    result['errors'].append((str(png_path), 'Conversion', _exc_detail(e)))
+                    return result
+            
             result['converted'] = 1
             
             # Upload to R2 with processed filename and metadata
             if self.s3_client:
-                upload_success = self.upload_to_r2(jpg_path, processed_filename, metadata)
-                if not upload_success:
-                    message = f"❌ {png_path.name} - upload failed"
-                    print(message)
-                    logger.info(message)
-                    result['errors'].append(f"Upload failed: {jpg_path.name}")
+                try:
+                    self.upload_bytes_to_r2(jpg_bytes, processed_filename, metadata)
+                except Exception as e:
+                    logger.debug("❌ %s - upload failed", png_path.name)
+                    result['errors'].append((str(png_path), 'Upload', _exc_detail(e)))
                     # Clean up JPG file even if upload failed
-                    if jpg_path.exists():
-                        jpg_path.unlink()
+                    if jpg_path:
+                        with suppress(FileNotFoundError):
+                            jpg_path.unlink()
                     return result
-                
-                result['uploaded'] = 1
                 status = "uploaded"
             else:
                 # For dry run
-                result['uploaded'] = 1
                 status = "dry-run"
             
-            # Cleanup local files if upload was successful
+            result['uploaded'] = 1
+            
+            # Cleanup local files if upload was successful (a JPG on disk is always one being kept)
             if cleanup_on_success:
-                self.cleanup_files(png_path, jpg_path, keep_converted)
+                self.cleanup_files(png_path)
                 result['cleaned'] = 1
                 cleanup_status = "PNG removed" if keep_converted else "cleaned"
             else:
                 cleanup_status = "kept"
             
-            message = f"✓ {png_path.name} -> {jpg_path.name} ({status}, {cleanup_status})"
-            print(message)
-            logger.info(message)
+            logger.debug("✓ %s -> %s (%s, %s)", png_path.name, processed_filename, status, cleanup_status)
             
         except Exception as e:
-            error_msg = f"Error processing {png_path.name}: {e}"
-            result['errors'].append(error_msg)
-            message = f"❌ {png_path.name} - error: {e}"
-            print(message)
-            logger.info(message)
+            result['errors'].append((str(png_path), 'Processing', _exc_detail(e)))
+            logger.debug("❌ %s - error: %s", png_path.name, e)
         
         return result
     
@@ -367,60 +741,272 @@ class ImageProcessor:
             'converted': 0,
             'uploaded': 0,
             'cleaned': 0,
-            'errors': []
+            'errors': deque()  # (path, stage, detail) records, formatted once when reported
         }
         
-        matching_images = self.find_matching_images()
-        if not matching_images:
+        pending_images = self._plan_uploads(self.find_matching_images(), results['errors'])
+        if not pending_images:
             return results
         
-        print(f"Processing {len(matching_images)} images with {self.max_workers} concurrent workers...")
+        print(f"Processing {len(pending_images)} images with {self.max_workers} concurrent workers...")
         
         # For batch database operations
         successfully_uploaded_cards = []
         
-        # Process images concurrently
-        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-            # Submit all tasks
-            future_to_path = {
-                executor.submit(self.process_single_image, png_path, cleanup_on_success, keep_converted): png_path 
-                for png_path in matching_images
-            }
+        self._start_encode_pool(len(pending_images))
+        try:
+            # Process images concurrently
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                # Submit all tasks
+                future_to_path = {
+                    executor.submit(self.process_single_image, png_path, cleanup_on_success, keep_converted, parsed): png_path
+                    for png_path, parsed in pending_images
+                }
             
-            # Collect results as they complete
-            for future in as_completed(future_to_path):
-                try:
-                    result = future.result()
-                    
-                    # Aggregate results
+                # Collect results as they complete
+                with _progress_bar(len(pending_images)) as pbar:
+                    for future in as_completed(future_to_path):
+                        try:
+                            result = future.result()
+                            
+                            # Aggregate results
+                            results['processed'] += result['processed']
+                            results['converted'] += result['converted']
+                            results['uploaded'] += result['uploaded']
+                            results['cleaned'] += result['cleaned']
+                            results['errors'].extend(result['errors'])
+                            
+                            # Collect card IDs for batch database update
+                            if result['uploaded'] > 0 and result['card_id'] and self.tracker and self.s3_client:
+                                successfully_uploaded_cards.append(result['card_id'])
+                            
+                        except Exception as e:
+                            error = (str(future_to_path[future]), 'Processing', _exc_detail(e))
+                            results['errors'].append(error)
+                            logger.error(format_error(error))
+                        
+                        # refresh=False: let update() redraw at tqdm's own rate instead of once per file
+                        pbar.set_postfix(uploaded=results['uploaded'], errors=len(results['errors']), refresh=False)
+                        pbar.update(1)
+        finally:
+            self._stop_encode_pool()
+        
+        self._record_uploads(successfully_uploaded_cards)
+        logger.debug(f"{self._fast_rgb_count} images took the RGB fast path")
+        return results
+    
+    async def process_images_async(self, cleanup_on_success: bool = True, keep_converted: bool = False,
+                                   max_in_flight: int = 32) -> dict:
+        """Asyncio variant of process_images: encodes in threads (or the process pool), uploads concurrently with aioboto3"""
+        if aioboto3 is None:
+            raise RuntimeError("process_images_async requires aioboto3 (pip install aioboto3)")
+        if max_in_flight < 1:
+            # A zero-slot semaphore would block every upload forever
+            raise ValueError(f"max_in_flight must be at least 1, got {max_in_flight}")
+        
+        results = {
+            'processed': 0,
+            'converted': 0,
+            'uploaded': 0,
+            'cleaned': 0,
+            'errors': deque()  # (path, stage, detail) records, formatted once when reported
+        }
+        
+        pending_images = self._plan_uploads(self.find_matching_images(), results['errors'])
+        if not pending_images:
+            return results
+        
+        print(f"Processing {len(pending_images)} images with up to {max_in_flight} concurrent uploads...")
+        
+        successfully_uploaded_cards = []
+        semaphore = asyncio.Semaphore(max_in_flight)
+        
+        async def process_one(s3, png_path: Path, parsed: Tuple[str, dict, str]) -> dict:
+            async with semaphore:
+                return await self._process_single_image_async(s3, png_path, cleanup_on_success, keep_converted, parsed)
+        
+        async def run(s3):
+            with _progress_bar(len(pending_images)) as pbar:
+                for next_result in asyncio.as_completed([process_one(s3, png_path, parsed) for png_path, parsed in pending_images]):
+                    result = await next_result
                     results['processed'] += result['processed']
                     results['converted'] += result['converted']
                     results['uploaded'] += result['uploaded']
                     results['cleaned'] += result['cleaned']
                     results['errors'].extend(result['errors'])
-                    
-                    # Collect card IDs for batch database update
-                    if result['uploaded'] > 0 and result['card_id'] and self.tracker and self.s3_client:
+                    if result['uploaded'] > 0 and result['card_id'] and self.tracker and s3:
                         successfully_uploaded_cards.append(result['card_id'])
-                        
+                    pbar.set_postfix(uploaded=results['uploaded'], errors=len(results['errors']), refresh=False)
+                    pbar.update(1)
+        
+        self._start_encode_pool(len(pending_images))
+        try:
+            if self._client_kwargs:
+                session = aioboto3.Session()
+                config = self._client_config.merge(Config(max_pool_connections=max_in_flight))
+                async with session.client('s3', **self._client_kwargs, config=config) as s3:
+                    await run(s3)
+            else:
+                # For dry run
+                await run(None)
+        finally:
+            self._stop_encode_pool()
+        
+        self._record_uploads(successfully_uploaded_cards)
+        logger.debug(f"{self._fast_rgb_count} images took the RGB fast path")
+        return results
+    
+    async def _process_single_image_async(self, s3, png_path: Path, cleanup_on_success: bool,
+                                          keep_converted: bool, parsed: Optional[Tuple[str, dict, str]] = None) -> dict:
+        """Process a single image on the event loop (blocking steps run in threads)"""
+        result = {
+            'processed': 0,
+            'converted': 0,
+            'uploaded': 0,
+            'cleaned': 0,
+            'errors': [],
+            'card_id': None
+        }
+        
+        try:
+            processed_filename, metadata, result['card_id'] = parsed or self.process_filename_for_upload(png_path)
+            result['processed'] = 1
+            
+            try:
+                jpg_bytes = await self.encode_jpg_async(png_path)
+            except Exception as e:
+                logger.debug("❌ %s - conversion failed", png_path.name)
+                result['errors'].append((str(png_path), 'Conversion', _exc_detail(e)))
+                return result
+            
+            # Only write the JPG to disk when it is kept after the run
+            jpg_path = None
+            if keep_converted or not cleanup_on_success:
+                jpg_path = png_path.parent / processed_filename
+                try:
+                    await asyncio.to_thread(jpg_path.write_bytes, jpg_bytes)
+                except OSError as e:
+                    logger.debug("❌ %s - conversion failed", png_path.name)
+                    result['errors'].append((str(png_path), 'Conversion', _exc_detail(e)))
+                    return result
+            
+            result['converted'] = 1
+            
+            if s3:
+                try:
+                    await s3.put_object(
+                        Bucket=self.bucket_name,
+                        Key=processed_filename,
+                        Body=jpg_bytes,
+                        Metadata=metadata or {},
+                        **self._object_headers
+                    )
                 except Exception as e:
-                    png_path = future_to_path[future]
-                    error_msg = f"Future execution error for {png_path.name}: {e}"
-                    results['errors'].append(error_msg)
-                    logger.error(error_msg)
+                    logger.debug("❌ %s - upload failed", png_path.name)
+                    result['errors'].append((str(png_path), 'Upload', _exc_detail(e)))
+                    # Clean up JPG file even if upload failed
+                    if jpg_path:
+                        with suppress(FileNotFoundError):
+                            jpg_path.unlink()
+                    return result
+                status = "uploaded"
+            else:
+                # For dry run
+                status = "dry-run"
+            
+            result['uploaded'] = 1
+            
+            if cleanup_on_success:
+                # A JPG on disk is always one being kept, so only the PNG goes
+                await asyncio.to_thread(self.cleanup_files, png_path)
+                result['cleaned'] = 1
+                cleanup_status = "PNG removed" if keep_converted else "cleaned"
+            else:
+                cleanup_status = "kept"
+            
+            logger.debug("✓ %s -> %s (%s, %s)", png_path.name, processed_filename, status, cleanup_status)
+            
+        except Exception as e:
+            result['errors'].append((str(png_path), 'Processing', _exc_detail(e)))
+            logger.debug("❌ %s - error: %s", png_path.name, e)
+        
+        return result
+    
+    def _plan_uploads(self, matching_images: List[Path], errors: Deque[Tuple[str, str, Optional[str]]]) -> List[Tuple[Path, Tuple[str, dict, str]]]:
+        """
+        Parse each filename once, set aside images whose card_id another image already claims, and
+        drop images whose card_id is already recorded as uploaded (one query instead of one per file)
+        
+        Args:
+            matching_images: PNGs found by find_matching_images
+            errors: Error records to add duplicate card_ids to
+        
+        Returns:
+            List of (png_path, (processed_filename, metadata, card_id)) for the workers
+        """
+        parse = self.process_filename_strict if self._pregen_only else self.process_filename_for_upload
+        planned = []
+        claimed = {}
+        for png_path in matching_images:
+            parsed = parse(png_path)
+            first = claimed.setdefault(parsed[2], png_path)
+            if first is png_path:
+                planned.append((png_path, parsed))
+            else:
+                # Same object key as an earlier image (e.g. a reused id in another --recursive shard):
+                # uploading would overwrite that image's JPG and then delete both PNGs
+                errors.append((str(png_path), 'Planning', f"duplicate object key {parsed[0]}, already used by {first}"))
         
-        # Batch update database for all successfully uploaded files
-        if successfully_uploaded_cards and self.tracker:
+        pending = planned
+        if self.tracker and planned:
+            card_ids = [parsed[2] for _, parsed in planned]
+            if len(card_ids) <= _PREFETCH_BY_KEY_MAX:
+                # Small incremental run: look up just these card_ids by primary key
+                uploaded = self.tracker.batch_check_uploaded(card_ids)
+            else:
+                # Large run: one scan of the table beats thousands of key lookups
+                uploaded = self.tracker.load_uploaded_set()
+            if uploaded:
+                pending = [item for item, card_id in zip(planned, card_ids) if card_id not in uploaded]
+        
+        # One summary line instead of a line per skipped file
+        skipped = len(planned) - len(pending)
+        if skipped:
+            print(f"Skipping {skipped} already uploaded images")
+            logger.info(f"Skipped {skipped} already uploaded images")
+        return pending
+    
+    def _start_encode_pool(self, image_count: int):
+        """Start the optional process pool for the CPU-bound encode stage"""
+        if self.processes > 0:
+            self._encode_pool = ProcessPoolExecutor(
+                # Spawned workers each import Pillow/numpy: don't start more than there are images
+                max_workers=min(self.processes, image_count),
+                # Worker threads (and boto3's) already exist by the time the pool starts: fork could copy held locks
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_transcode_worker,
+                initargs=(self.encoder,)
+            )
+    
+    def _stop_encode_pool(self):
+        if self._encode_pool:
+            self._encode_pool.shutdown()
+            self._encode_pool = None
+    
+    def _record_uploads(self, card_ids: List[str]):
+        """Batch update database for all successfully uploaded files"""
+        if card_ids and self.tracker:
             try:
-                self.tracker.batch_mark_uploaded(successfully_uploaded_cards)
-                logger.info(f"Batch updated {len(successfully_uploaded_cards)} upload records")
+                self.tracker.batch_mark_uploaded(card_ids)
+                logger.info(f"Batch updated {len(card_ids)} upload records")
             except Exception as e:
                 logger.error(f"Failed to batch update upload records: {e}")
-        
-        return results
+        if self.tracker:
+            self.tracker.close()
 
+@lru_cache(maxsize=4)
 def load_config(config_path: str) -> dict:
-    """Load R2 credentials from config file (JSON or INI format)"""
+    """Load R2 credentials from config file (JSON or INI format); cached per path, treat the result as read-only"""
     config_file = Path(config_path)
     if not config_file.exists():
         return {}
@@ -428,14 +1014,13 @@ def load_config(config_path: str) -> dict:
     try:
         # Try JSON format first
         if config_path.endswith('.json'):
-            with open(config_path, 'r') as f:
-                config = json.load(f)
-                return {
-                    'r2_endpoint': config.get('r2_endpoint'),
-                    'r2_access_key': config.get('r2_access_key'),
-                    'r2_secret_key': config.get('r2_secret_key'),
-                    'bucket_name': config.get('bucket_name')
-                }
+            config = _json_loads(config_file.read_bytes())
+            return {
+                'r2_endpoint': config.get('r2_endpoint'),
+                'r2_access_key': config.get('r2_access_key'),
+                'r2_secret_key': config.get('r2_secret_key'),
+                'bucket_name': config.get('bucket_name')
+            }
         
         # Try INI format
         else:
@@ -453,28 +1038,74 @@ def load_config(config_path: str) -> dict:
         logger.error(f"Failed to load config file {config_path}: {e}")
         return {}
 
+def _positive_int(value: str) -> int:
+    """argparse type for counts that must be at least 1"""
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {value}")
+    return number
+
 def main():
     parser = argparse.ArgumentParser(description='Process PNG images and upload to R2')
     parser.add_argument('directory', help='Directory to scan for images')
-    parser.add_argument('--pattern', default=r"pregen_\d+-\d+_\d+_\.png$", 
-                       help='Regex pattern for matching filenames (default: pregen_{id}-{seed}_{seq}_.png)')
-    parser.add_argument('--r2-endpoint', help='R2 endpoint URL')
+    parser.add_argument('--pattern', default=PREGEN_PATTERN,
+                       help='Regex pattern for matching filenames, case-insensitive '
+                            '(default: pregen_{id}-{seed}_{seq}_.png, lowercase only)')
+    parser.add_argument('--r2-endpoint',
+                       help='R2 endpoint URL. Request bodies are only signed over plain http; '
+                            'with https:// (the R2 default) TLS protects them instead')
     parser.add_argument('--r2-access-key', help='R2 access key')
     parser.add_argument('--r2-secret-key', help='R2 secret key')
     parser.add_argument('--bucket', required=True, help='R2 bucket name')
+    parser.add_argument('--recursive', action='store_true',
+                       help='Also process images in subdirectories')
     parser.add_argument('--quality', type=int, default=85, help='JPEG quality (1-100)')
+    parser.add_argument('--optimize-jpeg', action='store_true',
+                       help='Optimize JPEG Huffman tables: a few %% smaller files for about twice the '
+                            'encode CPU (Pillow encoder only)')
+    parser.add_argument('--max-dimension', type=_positive_int,
+                       help='Downscale images so neither side exceeds this many pixels (default: keep size)')
     parser.add_argument('--no-cleanup', action='store_true', 
                        help='Keep local files after upload')
     parser.add_argument('--dry-run', action='store_true',
                        help='Process files locally without uploading to R2')
     parser.add_argument('--keep-converted', action='store_true',
                        help='Keep converted JPG files, only remove original PNG files')
+    parser.add_argument('--encoder', choices=['auto', 'pillow', 'turbojpeg'], default='auto',
+                       help='JPEG encoder: pillow (uses the libjpeg-turbo bundled with Pillow wheels), '
+                            'turbojpeg (PyTurboJPEG, encodes without Pillow\'s save path) '
+                            'or auto (turbojpeg when installed, else pillow; default)')
+    parser.add_argument('--processes', type=int, default=0,
+                       help='Number of processes for PNG decode/JPEG encode, -1 for one per CPU '
+                            '(default: 0, encode in the worker threads)')
+    parser.add_argument('--async', dest='use_async', action='store_true',
+                       help='Upload from an asyncio event loop with aioboto3 instead of worker threads')
+    parser.add_argument('--multipart-threshold', type=int, default=8,
+                       help='Upload files of at least this many MiB in parts (default: 8)')
+    parser.add_argument('--chunk-size', type=int, default=8,
+                       help='Part size in MiB for multipart uploads (default: 8)')
+    parser.add_argument('--s3-concurrency', type=int, default=8,
+                       help='Parts uploaded in parallel per multipart upload (default: 8)')
+    parser.add_argument('--max-in-flight', type=_positive_int, default=32,
+                       help='Maximum concurrent uploads with --async (default: 32)')
+    parser.add_argument('--verbose', action='store_true',
+                       help='Log a line per processed file (DEBUG level)')
+    parser.add_argument('--log-console', action='store_true',
+                       help='Also print log messages to the console (default: image_processor.log only)')
+    parser.add_argument('--tracker-mode', choices=['disk', 'memory'], default='disk',
+                       help='Where to track uploaded files: disk (upload_tracker.db, default) '
+                            'or memory (this run only, e.g. for throwaway staging runs)')
     parser.add_argument('--config', help='Path to config file (JSON or INI format)')
-    parser.add_argument('--max-workers', type=int, default=4,
-                       help='Maximum number of concurrent workers (default: 4)')
+    parser.add_argument('--workers', '--max-workers', dest='max_workers', type=_positive_int, default=None,
+                       help='Maximum number of concurrent workers (default: min(32, cpu_count * 4))')
     
     args = parser.parse_args()
     
+    if args.verbose:
+        logger.setLevel(logging.DEBUG)
+    if args.log_console:
+        _enable_console_logging()
+    
     # Load config file if provided
     config = {}
     if args.config:
@@ -507,11 +1138,27 @@ def main():
             r2_secret_key=r2_secret_key if not args.dry_run else None,
             bucket_name=bucket_name,
             jpg_quality=args.quality,
+            optimize_jpeg=args.optimize_jpeg,
+            max_dimension=args.max_dimension,
             track_uploads=True,
-            max_workers=args.max_workers
+            tracker_mode=args.tracker_mode,
+            max_workers=args.max_workers,
+            encoder=args.encoder,
+            processes=args.processes,
+            multipart_threshold=args.multipart_threshold * 1024 * 1024,
+            multipart_chunksize=args.chunk_size * 1024 * 1024,
+            s3_concurrency=args.s3_concurrency,
+            recursive=args.recursive
         )
         
-        results = processor.process_images(cleanup_on_success=not args.no_cleanup, keep_converted=args.keep_converted)
+        if args.use_async:
+            results = asyncio.run(processor.process_images_async(
+                cleanup_on_success=not args.no_cleanup,
+                keep_converted=args.keep_converted,
+                max_in_flight=args.max_in_flight
+            ))
+        else:
+            results = processor.process_images(cleanup_on_success=not args.no_cleanup, keep_converted=args.keep_converted)
         
         # Print summary
         summary = f"Summary: {results['processed']} processed, {results['converted']} converted, {results['uploaded']} uploaded, {results['cleaned']} cleaned, {len(results['errors'])} errors"
@@ -520,7 +1167,7 @@ def main():
         
         if results['errors']:
             for error in results['errors']:
-                logger.error(error)
+                logger.error(format_error(error))
         
         return 0 if not results['errors'] else 1
         
@@ -12,6 +12,7 @@ APT_PACKAGES=(
 
 PIP_PACKAGES=(
     "boto3"
+    "tqdm"
 )
 
 NODES=(